@@ -1,5 +1,6 @@
 # chapter_blueprint_parser.py
 # -*- coding: utf-8 -*-
+import functools
 import re
 
 def parse_chapter_blueprint(blueprint_text: str):
@@ -110,15 +111,27 @@ def parse_chapter_blueprint(blueprint_text: str):
     return results
 
 
+@functools.lru_cache(maxsize=4)
+def _index_blueprint(blueprint_text: str) -> dict:
+    """
+    将整份蓝图文本解析一次，返回以章号为键的字典 {chapter_number: dict}。
+    以文本本身作为缓存键，内容变化后自动重新解析；调用方需返回副本，避免改写缓存。
+    同一章号出现多次时保留第一次出现的条目，与逐条查找的结果一致。
+    """
+    index = {}
+    for ch in parse_chapter_blueprint(blueprint_text):
+        index.setdefault(ch["chapter_number"], ch)
+    return index
+
+
 def get_chapter_info_from_blueprint(blueprint_text: str, target_chapter_number: int):
     """
     在已经加载好的章节蓝图文本中，找到对应章号的结构化信息，返回一个 dict。
     若找不到则返回一个默认的结构。
     """
-    all_chapters = parse_chapter_blueprint(blueprint_text)
-    for ch in all_chapters:
-        if ch["chapter_number"] == target_chapter_number:
-            return ch
+    ch = _index_blueprint(blueprint_text).get(target_chapter_number)
+    if ch is not None:
+        return dict(ch)
     # 默认返回
     return {
         "chapter_number": target_chapter_number,
@@ -130,3 +143,34 @@ def get_chapter_info_from_blueprint(blueprint_text: str, target_chapter_number:
         "plot_twist_level": "",
         "chapter_summary": ""
     }
+
+
+@functools.lru_cache(maxsize=4)
+def _parse_directory(directory_text: str) -> dict:
+    """
+    将整份目录文本解析一次，返回以章号为键的字典：
+    {chapter_number: {"chapter_title": str, "chapter_brief": str}}
+    以目录文本本身作为缓存键，目录内容变化后自动重新解析。
+    """
+    return {
+        num: {
+            "chapter_title": ch["chapter_title"],
+            "chapter_brief": ch["chapter_summary"]
+        }
+        for num, ch in _index_blueprint(directory_text).items()
+    }
+
+
+def get_chapter_info_from_directory(directory_text: str, target_chapter_number: int):
+    """
+    从目录文本中取出对应章号的标题与简介，返回一个 dict：
+    {"chapter_title": str, "chapter_brief": str}
+    若找不到则返回默认标题与空简介。
+    """
+    info = _parse_directory(directory_text).get(target_chapter_number)
+    if info is None:
+        return {
+            "chapter_title": f"第{target_chapter_number}章",
+            "chapter_brief": ""
+        }
+    return dict(info)
@@ -0,0 +1,83 @@
+# embedding_cache.py
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# SQLite 单条语句可绑定的参数个数有限，批量查询时分段进行
+_SQLITE_MAX_VARS = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    为 embeddings 对象加一层本地 SQLite 缓存。
+    键为 sha256("接口格式|模型名|文本")，值为 float32 向量的字节串，
+    同一文本在同一模型下只会请求一次 embedding 接口。
+    """
+    def __init__(self, underlying: Embeddings, db_path: str, interface_format: str, embedding_model_name: str):
+        self.underlying = underlying
+        self.db_path = db_path
+        self.interface_format = interface_format
+        self.embedding_model_name = embedding_model_name
+
+    def _connect(self) -> sqlite3.Connection:
+        # 向量库被清空时缓存文件也会被删除，因此每次连接都确保表存在
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS embed_cache (key TEXT PRIMARY KEY, vector BLOB)")
+        return conn
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.interface_format}|{self.embedding_model_name}|{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with closing(self._connect()) as conn:
+            for i in range(0, len(unique_keys), _SQLITE_MAX_VARS):
+                batch = unique_keys[i:i + _SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embed_cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _save(self, items: Dict[str, List[float]]):
+        rows = [
+            (key, np.asarray(vec, dtype=np.float32).tobytes())
+            for key, vec in items.items()
+            if vec  # Ollama 请求失败时返回空向量，不写入缓存
+        ]
+        if not rows:
+            return
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embed_cache (key, vector) VALUES (?, ?)", rows)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        cached = self._lookup(keys)
+
+        miss_texts = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in miss_texts:
+                miss_texts[key] = text
+
+        if miss_texts:
+            vectors = self.underlying.embed_documents(list(miss_texts.values()))
+            new_items = dict(zip(miss_texts.keys(), vectors))
+            self._save(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
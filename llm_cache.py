@@ -0,0 +1,54 @@
+# llm_cache.py
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from typing import Optional
+
+# 缓存指纹中的 prompt 版本号。修改 prompt 模板或回复清洗逻辑后递增，旧缓存自动失效
+PROMPT_VERSION = "1"
+
+
+def is_llm_cache_enabled(temperature: Optional[float]) -> bool:
+    """
+    只有确定性调用（temperature == 0）才默认走缓存，避免随机生成被固定成同一结果；
+    设置环境变量 FORCE_LLM_CACHE=1 可强制对所有调用启用缓存（调试、重跑时使用）。
+    """
+    if os.environ.get("FORCE_LLM_CACHE", "").strip().lower() in ("1", "true", "yes"):
+        return True
+    return temperature == 0
+
+
+class LLMResponseCache:
+    """
+    基于本地 SQLite 的 LLM 回复精确匹配缓存，键为 sha256("模型名|温度|prompt版本|prompt")。
+    不做语义（近似）匹配：相邻章节的 prompt 大部分内容相同，近似命中会返回别的章节的结果。
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        # 缓存文件可能随向量库一起被清空，因此每次连接都确保表存在
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT)")
+        return conn
+
+    @staticmethod
+    def make_key(model_name: str, temperature: Optional[float], prompt: str,
+                 prompt_version: str = PROMPT_VERSION) -> str:
+        raw = f"{model_name}|{temperature}|{prompt_version}|{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        if not response:
+            return
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, response) VALUES (?, ?)", (key, response))
@@ -3,28 +3,72 @@
 import tkinter as tk
 from ui import NovelGeneratorGUI
 import logging
+import os
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, MemoryHandler
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """
+    支持整批写入的 RotatingFileHandler：一批记录先全部格式化，
+    轮换检查只做一次，再对文件 write、flush 各一次
+    """
+    def emit_batch(self, records):
+        records = [r for r in records if r.levelno >= self.level and self.filter(r)]
+        if not records:
+            return
+        self.acquire()
+        try:
+            text = "".join(self.format(r) + self.terminator for r in records)
+            if self.stream is None:
+                self.stream = self._open()
+            # 与 shouldRollover 相同的判断，只是以整批文本的长度计算
+            if self.maxBytes > 0 and not (os.path.exists(self.baseFilename) and not os.path.isfile(self.baseFilename)):
+                self.stream.seek(0, 2)
+                if self.stream.tell() + len(text) >= self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+            self.stream.write(text)
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class BatchMemoryHandler(MemoryHandler):
+    """
+    MemoryHandler 默认 flush 时逐条调用 target.handle，每条都会 write + flush 一次；
+    这里把整批记录一次性交给 BatchRotatingFileHandler.emit_batch
+    """
+    def flush(self):
+        self.acquire()
+        try:
+            if self.target and self.buffer:
+                self.target.emit_batch(self.buffer)
+                self.buffer.clear()
+        finally:
+            self.release()
+
 
 log_format = '[%(asctime)s.%(msecs)03d %(filename)s %(lineno)d] %(message)s'
 date_format = '%Y-%m-%d %H:%M:%S'
+rotating_file_handler = BatchRotatingFileHandler('logs/log_file.log', maxBytes=16384*64, encoding='utf-8')
+rotating_file_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+# 日志先缓存在内存中，攒满 512 条或遇到 ERROR 时再整批写入文件（一次 write + 一次 flush），
+# 程序退出时 logging.shutdown 会把剩余内容刷入文件
+buffered_file_handler = BatchMemoryHandler(capacity=512, flushLevel=logging.ERROR, target=rotating_file_handler)
 logging.basicConfig(level=logging.DEBUG, format=log_format, datefmt=date_format,
-                    handlers=[logging.StreamHandler(),
-                              RotatingFileHandler('logs/log_file.log', maxBytes=16384*64, encoding='utf-8')])
-# 获取配置中的 RotatingFileHandler
-rotating_file_handler = None
-for handler in logging.root.handlers:
-    if isinstance(handler, RotatingFileHandler):
-        rotating_file_handler = handler
-        break
+                    handlers=[logging.StreamHandler(), buffered_file_handler])
 
 
 # 自定义一个类，重定向 print 的输出
 # 重定向 print 输出的类
 class DualOutput:
-    def __init__(self, file_handler: RotatingFileHandler):
+    def __init__(self, file_handler: BatchMemoryHandler):
         self.console = sys.stdout  # 原始控制台输出
-        self.file_handler = file_handler  # 日志文件处理器
+        self.file_handler = file_handler  # 带缓冲的日志文件处理器
 
     def write(self, message):
         # 写入控制台
@@ -32,31 +76,25 @@ class DualOutput:
 
         # 过滤掉包含回车符的消息，避免日志文件混乱
         if '\r' not in message and message.strip() != '':
-            # 使用线程锁确保写入安全
-            with self.file_handler.lock:
-                record = logging.LogRecord(
-                    name=__name__,
-                    level=logging.INFO,
-                    pathname=__file__,
-                    lineno=1,
-                    msg=message,
-                    args=None,
-                    exc_info=None
-                )
-                if self.file_handler.shouldRollover(record):  # 触发轮换逻辑
-                    self.file_handler.doRollover()
-                self.file_handler.emit(record)
+            record = logging.LogRecord(
+                name=__name__,
+                level=logging.INFO,
+                pathname=__file__,
+                lineno=1,
+                msg=message,
+                args=None,
+                exc_info=None
+            )
+            # 交给 MemoryHandler 缓冲，由其批量写入并触发轮换
+            self.file_handler.handle(record)
+
     def flush(self):
-        # 同步刷新控制台和文件的缓冲区
+        # 只刷新控制台，文件部分由 MemoryHandler 批量写入
         self.console.flush()
-        with self.file_handler.lock:
-            if self.file_handler.stream:
-                self.file_handler.stream.flush()
 
 
 # 执行重定向
-if rotating_file_handler:
-    sys.stdout = DualOutput(rotating_file_handler)
+sys.stdout = DualOutput(buffered_file_handler)
 
 
 def main():
@@ -64,9 +102,6 @@ def main():
     root = tk.Tk()
     root.title("Novel Generator")
     app = NovelGeneratorGUI(root)
-    log_format = '[%(asctime)s.%(msecs)03d %(filename)s %(lineno)d] %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
-    logging.basicConfig(level=logging.INFO, format=log_format, datefmt=date_format)
     root.mainloop()
 
 
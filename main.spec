@@ -7,10 +7,8 @@ hiddenimports = ['typing_extensions',
                  'langchain-openai',
                  'langgraph', 
                  'openai', 
-                 'nltk',
-                 'sentence_transformers',
-                 'scikit-learn',
                  'langchain-community',
+                 'numba',
                  'pydantic',
                  'pydantic.deprecated.decorator',
                  'tiktoken_ext.openai_public',
@@ -21,6 +19,11 @@ hiddenimports = ['typing_extensions',
 tmp_ret = collect_all('chromadb')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 
+# numba 在导入知识库时才按需导入，llvmlite 的动态库需要一并打包
+for pkg in ('numba', 'llvmlite'):
+    tmp_ret = collect_all(pkg)
+    datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
+
 customtkinter_dir = r'c:/Users/xieli/Desktop/AI_NovelGenerator/.venv/Lib/site-packages/customtkinter'
 datas.append((customtkinter_dir, 'customtkinter'))
 
@@ -1,13 +1,18 @@
 # novel_generator.py
 # -*- coding: utf-8 -*-
 import asyncio
+import functools
+import itertools
 import os
 import logging
+import mmap
 import re
+import threading
 import traceback
 import re
-from typing import List, Optional
-import datetime, time
+import uuid
+from typing import Iterator, List, Optional
+import datetime
 
 import async_timeout
 from langchain_core.messages import BaseMessage, AIMessage
@@ -17,16 +22,13 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.docstore.document import Document
 
-# nltk、sentence_transformers 及文本处理相关
-import nltk
+# 文本处理相关（numba 较重，在导入知识库时才按需加载）
 import math
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 
 # 工具函数
 from utils import (
-    read_file, append_text_to_file, clear_file_content,
-    save_string_to_txt
+    read_file, append_text_to_file, atomic_write_text
 )
 
 # prompt模板
@@ -42,59 +44,105 @@ from prompt_definitions import (
 
 # Ollama嵌入 (如使用Ollama时需要)
 from embedding_ollama import OllamaEmbeddings
+# embedding 本地缓存
+from embedding_cache import CachedEmbeddings
+# LLM 回复本地缓存
+from llm_cache import LLMResponseCache, is_llm_cache_enabled
+# 流式过滤 <think> 思考内容
+from think_filter import ThinkTagFilter
 
 # 用于目录解析章节标题/简介
 from chapter_directory_parser import get_chapter_info_from_directory
 from langchain_community.chat_message_histories import ChatMessageHistory
 import shutil
-
-
-# ============ 日志配置 ============
-# logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+from concurrent.futures import ThreadPoolExecutor
 
 
 # ============ 通用调用函数 ============
-def remove_think_tags(text: str) -> str:
+async def async_stream_collector(chat: ChatOpenAI, chat_history: ChatMessageHistory, timeout_sec: int,
+                                 think_filter: ThinkTagFilter, tag: str = "") -> tuple[str, str] | Exception:
     """
-    移除 <think>...</think> 包裹的内容
-    """
-    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-
-
-async def async_stream_collector(chat: ChatOpenAI, chat_history: ChatMessageHistory, timeout_sec: int) -> str | Exception:
-    """
-    异步流式收集器
+    异步流式收集器，接收时即过滤 <think>...</think>
     :param chat: 模型
     :param chat_history: 聊天历史
     :param timeout_sec: 总超时时间
-    :return: 完整结果字符串
+    :param think_filter: 整次回答共用的过滤器，思考区间可能跨越多轮续写
+    :param tag: 多路请求并发时的输出标签；设置后不逐块打印，本轮结束时带标签整体打印一次
+    :return: (本轮原始文本, 本轮过滤后的文本)
     """
-    result = []
+    raw_parts = []
+    visible_parts = []
     logging.info(f"{chat.model_dump_json()}")
     try:
         async with async_timeout.timeout(timeout_sec):
             async for chunk in chat.astream(chat_history.messages):
-                if len(chunk.content) == 0:
-                    print('\r 思索中...', end='')
+                raw_parts.append(chunk.content)
+                text = think_filter.feed(chunk.content)
+                if len(text) == 0:
+                    if not tag:
+                        print('\r 思索中...', end='')
                     continue
-                result.append(chunk.content)
-                print(chunk.content, end='')
-        return "".join(result)
+                visible_parts.append(text)
+                if not tag:
+                    print(text, end='')
+        visible_text = "".join(visible_parts)
+        if tag:
+            print(f"[{tag}] {visible_text}", end='')
+        return "".join(raw_parts), visible_text
 
     except Exception as e:
         logging.info("响应超时")
         return e
 
 
+# ============ 模型请求专用事件循环 ============
+# _get_chat 缓存的 ChatOpenAI 内部持有 httpx.AsyncClient，其连接池既不是线程安全的，
+# 连接也绑定在创建它的事件循环上。所有流式请求因此都提交到同一个常驻后台事件循环中执行，
+# 而不是在各个线程里各自 asyncio.run。
+_llm_loop: Optional[asyncio.AbstractEventLoop] = None
+_llm_loop_lock = threading.Lock()
+
+
+def _get_llm_loop() -> asyncio.AbstractEventLoop:
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _llm_loop = loop
+        return _llm_loop
+
+
+def run_in_llm_loop(coro):
+    """
+    在模型请求专用事件循环中执行协程，阻塞等待并返回结果（不可在该事件循环内部调用）
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_llm_loop()).result()
+
+
 def invoke_with_cleaning(model: ChatOpenAI, prompt: str, retry: int | None = 100) -> str:
     """
     通用封装：调用模型并移除 <think>...</think> 文本，记录日志后返回
     """
+    return run_in_llm_loop(async_invoke_with_cleaning(model, prompt, retry))
+
+
+async def async_invoke_with_cleaning(model: ChatOpenAI, prompt: str, retry: int | None = 100, tag: str = "") -> str:
+    """
+    invoke_with_cleaning 的协程版本，需在 run_in_llm_loop 中执行；
+    多个请求并发时用 tag 区分各自的输出
+    """
     logging.info(f"[prompt] {prompt.replace('\\n', '\n')}")
+    use_cache = is_llm_cache_enabled(model.temperature)
+    if use_cache:
+        llm_cache = LLMResponseCache(LLM_CACHE_FILE)
+        cache_key = LLMResponseCache.make_key(model.model_name, model.temperature, prompt)
+        cached_text = llm_cache.get(cache_key)
+        if cached_text is not None:
+            logging.info("[LLM cache] 命中缓存，跳过模型调用")
+            return cached_text
     total_request_start_time = datetime.datetime.now()
     end_mark = "###"
-    model.streaming = True
-    time.sleep(1)
     # 先礼后兵 浪费钱
     # for chunk in model.stream("你好"):
     #     if len(chunk.content) == 0:
@@ -107,44 +155,26 @@ def invoke_with_cleaning(model: ChatOpenAI, prompt: str, retry: int | None = 100
         chat_history = ChatMessageHistory()
         chat_history.add_user_message(
             prompt + f"\n在末尾请发出{end_mark}表示你的回答已经结束，末尾不要有{end_mark}以外的任何多余符号")
-        msg = ""
-        before_len = 0
-        request_start_time = datetime.datetime.now()
-        # async with async_timeout.timeout(20*60):
-        #     async for chunk in model.astream(chat_history.messages):
-        #         if len(chunk.content) == 0:
-        #             print("\r 还在思考中，返回空白内容...", end='')
-        #             continue
-        #         print(f"{chunk.content}", end='')
-        #         msg += chunk.content
-        resp = asyncio.run(async_stream_collector(model, chat_history, 20*60))
-        if isinstance(resp, Exception):
-            raise resp
-        msg += resp
-        chat_history.add_ai_message(resp)
-        request_spend_time = datetime.datetime.now() - request_start_time
-        print(f"\n回答告一段落，本次回答耗时{request_spend_time}")
-        while not msg.strip().endswith(end_mark):
+        # 每轮过滤后的回复追加到 parts，最后只拼接一次；
+        # 聊天历史中保留原始文本，思考被截断时模型才能在下一轮接着写完
+        parts: list[str] = []
+        think_filter = ThinkTagFilter()
+        while True:
             request_start_time = datetime.datetime.now()
+            turn = await async_stream_collector(model, chat_history, 20 * 60, think_filter, tag)
+            if isinstance(turn, Exception):
+                raise turn
+            raw_text, turn_text = turn
+            parts.append(turn_text)
+            chat_history.add_ai_message(raw_text)
+            request_spend_time = datetime.datetime.now() - request_start_time
+            print(f"\n{f'[{tag}] ' if tag else ''}回答告一段落，本次回答耗时{request_spend_time}")
+            if raw_text.rstrip().endswith(end_mark):
+                break
             chat_history.add_user_message(
                 f"请接着最后一句话继续。如果最后一句话没有说完，就将最后一句话补全后再继续,接续处直接写正文即可，不要有多余内容\n在末尾请发出{end_mark}表示你的回答已经结束，末尾不要有{end_mark}以外的任何多余符号")
-            # think_log_flag = False
-            # async with async_timeout.timeout(20 * 60):
-            #     async for chunk in model.astream(chat_history.messages):
-            #         if len(chunk.content) == 0:
-            #             if not think_log_flag:
-            #                 print("还在思考中，返回空白内容...")
-            #                 think_log_flag = True
-            #             continue
-            #         print(f"{chunk.content}", end='')
-            #         msg += chunk.content
-            resp = asyncio.run(async_stream_collector(model, chat_history, 20 * 60))
-            if isinstance(resp, Exception):
-                raise resp
-            msg += resp
-            chat_history.add_ai_message(resp)
-            request_spend_time = datetime.datetime.now() - request_start_time
-            print(f"\n回答告一段落，本次回答耗时{request_spend_time}")
+        parts.append(think_filter.flush())
+        msg = "".join(parts)
         logging.info(f"\n思考完毕,全文长度{len(msg)}")
         response = AIMessage(content=msg)
         print('\a')
@@ -153,9 +183,11 @@ def invoke_with_cleaning(model: ChatOpenAI, prompt: str, retry: int | None = 100
         if not response:
             logging.warning("No response from model.")
             return ""
-        cleaned_text = remove_think_tags(response.content)
+        cleaned_text = response.content.strip()
         debug_log(prompt, cleaned_text)
-        return cleaned_text.strip()
+        if use_cache:
+            llm_cache.set(cache_key, cleaned_text)
+        return cleaned_text
     except Exception as e:
         total_request_spend_time = datetime.datetime.now() - total_request_start_time
         logging.info(f"请求耗时{total_request_spend_time}ms 请求失败")
@@ -163,7 +195,7 @@ def invoke_with_cleaning(model: ChatOpenAI, prompt: str, retry: int | None = 100
         logging.error(f"{retry=}")
         if retry < 0:
             raise e
-        return invoke_with_cleaning(model, prompt, retry - 1)
+        return await async_invoke_with_cleaning(model, prompt, retry - 1, tag)
 
 
 def debug_log(prompt: str, response_content: str):
@@ -201,13 +233,32 @@ def ensure_openai_base_url_has_v1(url: str) -> str:
     url = url.strip()
     if not url:
         return url
-    # 若末尾没有 /v\d+，但也没出现 /v1，才补上
-    if not re.search(r'/v\d+$', url):
+    # 若末尾没有 /v\d+，但也没出现 /v1，才补上（纯字符串判断，等价于 re.search(r'/v\d+$', url)）
+    _, sep, last_segment = url.rpartition('/')
+    if not (sep and last_segment[:1] == 'v' and last_segment[1:].isdecimal()):
         if '/v1' not in url:
             url = url.rstrip('/') + '/v1'
     return url
 
 
+# ============ 创建 ChatOpenAI 对象 ============
+@functools.lru_cache(maxsize=16)
+def _get_chat(model_name: str, api_key: str, base_url: str, temperature: float) -> ChatOpenAI:
+    """
+    按配置复用 ChatOpenAI 客户端，保留其 HTTP 连接池。
+    客户端自带指数退避重试 5 次；更长时间的失败由 invoke_with_cleaning 自身的重试兜底。
+    """
+    return ChatOpenAI(
+        model=model_name,
+        api_key=api_key,
+        base_url=ensure_openai_base_url_has_v1(base_url),
+        temperature=temperature,
+        max_tokens=8192,
+        max_retries=5,
+        streaming=True
+    )
+
+
 # ============ 创建 Embeddings 对象 ============
 def create_embeddings_object(
         api_key: str,
@@ -221,10 +272,11 @@ def create_embeddings_object(
     - 当 interface_format = "Ollama" => OllamaEmbeddings(...)
     - 当 interface_format = "OpenAI"/"ML Studio" => OpenAIEmbeddings(...)
     这里统一把 base_url/embed_url 处理为含 /v1。
+    返回的对象外包一层 CachedEmbeddings，按内容哈希缓存 embedding 结果。
     """
     if is_using_ollama_api(interface_format, embed_url):
         fixed_url = embed_url.rstrip("/")
-        return OllamaEmbeddings(
+        embeddings = OllamaEmbeddings(
             model_name=embedding_model_name,
             base_url=fixed_url
         )
@@ -233,35 +285,103 @@ def create_embeddings_object(
         # 并设置 model=embedding_model_name
         # base_url/embed_url 若不含 /v1，需要自动补上
         fixed_url = ensure_openai_base_url_has_v1(embed_url if embed_url else base_url)
-        return OpenAIEmbeddings(
+        embeddings = OpenAIEmbeddings(
             openai_api_key=api_key,
             openai_api_base=fixed_url,
             model=embedding_model_name
         )
+    # 相同文本在同一模型下只请求一次，重复导入/重建向量库时直接命中本地缓存
+    return CachedEmbeddings(
+        underlying=embeddings,
+        db_path=EMBED_CACHE_FILE,
+        interface_format=interface_format,
+        embedding_model_name=embedding_model_name
+    )
 
 
 # ============ 向量库相关 ============
 VECTOR_STORE_DIR = os.path.join(os.getcwd(), "vectorstore")
+EMBED_CACHE_FILE = os.path.join(VECTOR_STORE_DIR, "embed_cache.sqlite")
+LLM_CACHE_FILE = os.path.join(VECTOR_STORE_DIR, "llm_cache.sqlite")
+# 导入知识库时每次 embedding 请求包含的段落数，以及同时进行的请求数
+EMBED_BATCH_SIZE = 256
+EMBED_MAX_CONCURRENCY = 8
 if not os.path.exists(VECTOR_STORE_DIR):
     os.makedirs(VECTOR_STORE_DIR)
+# 向量库是否已初始化；写入时据此判断，无需先打开向量库探测
+_store_exists = os.path.exists(os.path.join(VECTOR_STORE_DIR, "chroma.sqlite3"))
+
+
+@functools.lru_cache(maxsize=8)
+def _get_embeddings(
+        api_key: str,
+        base_url: str,
+        interface_format: str,
+        embedding_model_name: str,
+        embedding_base_url: str = ""
+):
+    """
+    按配置复用 embeddings 对象，避免每次读写向量库都重新构造客户端。
+    """
+    embed_url = embedding_base_url if embedding_base_url else base_url
+    return create_embeddings_object(
+        api_key=api_key,
+        base_url=base_url,
+        embed_url=embed_url,
+        interface_format=interface_format,
+        embedding_model_name=embedding_model_name
+    )
+
+
+# 已打开的 Chroma 向量库，键为 (向量库目录, 接口格式, embedding 模型, embedding 地址, api_key)
+_STORE_CACHE: dict = {}
+_store_cache_lock = threading.Lock()
+
+
+def _store_cache_key(api_key: str, base_url: str, interface_format: str,
+                     embedding_model_name: str, embedding_base_url: str = "") -> tuple:
+    embed_url = embedding_base_url if embedding_base_url else base_url
+    return VECTOR_STORE_DIR, interface_format, embedding_model_name, embed_url, api_key
+
+
+def _get_store_and_embeddings(
+        api_key: str,
+        base_url: str,
+        interface_format: str,
+        embedding_model_name: str,
+        embedding_base_url: str = ""
+) -> tuple:
+    """
+    按配置复用已打开的 Chroma 向量库及其 embeddings 对象，返回 (store, embeddings)。
+    向量库被清空时需调用 _STORE_CACHE.clear()。
+    """
+    embeddings = _get_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    key = _store_cache_key(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    with _store_cache_lock:
+        store = _STORE_CACHE.get(key)
+        if store is None:
+            store = Chroma(persist_directory=VECTOR_STORE_DIR, embedding_function=embeddings)
+            _STORE_CACHE[key] = store
+    return store, embeddings
 
 
 def clear_vector_store():
     """
     清空本地向量库（删除 vectorstore 文件夹内的所有内容）
     """
+    global _store_exists
+    clear_query_cache()
+    with _store_cache_lock:
+        _STORE_CACHE.clear()
+    _store_exists = False
     if os.path.exists(VECTOR_STORE_DIR):
-
+        # 整个目录一次性递归删除后重建，不逐个文件处理
         try:
-            for filename in os.listdir(VECTOR_STORE_DIR):
-                file_path = os.path.join(VECTOR_STORE_DIR, filename)
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+            shutil.rmtree(VECTOR_STORE_DIR)
             logging.info("Local vector store has been cleared.")
         except Exception:
             logging.warning(f"Failed to clear vector store:\n{traceback.format_exc()}")
+        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
     else:
         logging.info("No vector store found to clear.")
 
@@ -277,14 +397,8 @@ def init_vector_store(
     """
     初始化并返回一个Chroma向量库，将传入的文本进行嵌入并保存到本地目录。
     """
-    embed_url = embedding_base_url if embedding_base_url else base_url
-    embeddings = create_embeddings_object(
-        api_key=api_key,
-        base_url=base_url,
-        embed_url=embed_url,
-        interface_format=interface_format,
-        embedding_model_name=embedding_model_name
-    )
+    global _store_exists
+    embeddings = _get_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
     documents = [Document(page_content=str(t)) for t in texts]  # 确保是字符串
     vectorstore = Chroma.from_documents(
         documents,
@@ -292,6 +406,12 @@ def init_vector_store(
         persist_directory=VECTOR_STORE_DIR
     )
     vectorstore.persist()
+    clear_query_cache()
+    # 直接复用刚建好的实例，后续读写无需重新打开向量库
+    key = _store_cache_key(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    with _store_cache_lock:
+        _STORE_CACHE[key] = vectorstore
+    _store_exists = True
     return vectorstore
 
 
@@ -309,15 +429,8 @@ def load_vector_store(
         logging.info("Vector store not found. Will return None.")
         return None
 
-    embed_url = embedding_base_url if embedding_base_url else base_url
-    embeddings = create_embeddings_object(
-        api_key=api_key,
-        base_url=base_url,
-        embed_url=embed_url,
-        interface_format=interface_format,
-        embedding_model_name=embedding_model_name
-    )
-    return Chroma(persist_directory=VECTOR_STORE_DIR, embedding_function=embeddings)
+    store, _ = _get_store_and_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    return store
 
 
 def update_vector_store(
@@ -331,15 +444,7 @@ def update_vector_store(
     """
     将最新章节文本插入到向量库里，用于后续检索参考。若库不存在则初始化。
     """
-    store = load_vector_store(
-        api_key=api_key,
-        base_url=base_url,
-        interface_format=interface_format,
-        embedding_model_name=embedding_model_name,
-        embedding_base_url=embedding_base_url
-    )
-
-    if not store:
+    if not _store_exists:
         logging.info("Vector store does not exist. Initializing a new one for new chapter...")
         init_vector_store(
             api_key=api_key,
@@ -351,9 +456,10 @@ def update_vector_store(
         )
         return
 
-    new_doc = Document(page_content=str(new_chapter))
-    store.add_documents([new_doc])
+    store, _ = _get_store_and_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    store.add_texts([str(new_chapter)])
     store.persist()
+    clear_query_cache()
     logging.info("Vector store updated with the new chapter.")
 
 
@@ -370,6 +476,36 @@ def get_relevant_context_from_vector_store(
     从向量库中检索与 query 最相关的 k 条文本，拼接后返回。
     若向量库不存在或没有足够内容，则返回空字符串。
     """
+    return "\n".join(get_relevant_contexts_from_vector_store(
+        api_key=api_key,
+        base_url=base_url,
+        queries=[query],
+        interface_format=interface_format,
+        embedding_model_name=embedding_model_name,
+        embedding_base_url=embedding_base_url,
+        k=k
+    )[0])
+
+
+def get_relevant_contexts_from_vector_store(
+        api_key: str,
+        base_url: str,
+        queries: List[str],
+        interface_format: str,
+        embedding_model_name: str,
+        embedding_base_url: str = "",
+        k: int = 2
+) -> List[List[str]]:
+    """
+    对多个 query 分别检索最相关的 k 条文本，按 query 顺序返回各自命中的文本列表，
+    不同 query 命中的同一段文本由调用方按需去重。
+    所有 query 合并为一次 embedding 请求（重复的 query 会命中本地 embedding 缓存），
+    未命中检索缓存的 query 并发执行向量检索。
+    """
+    results: List[List[str]] = [[] for _ in queries]
+    if not queries:
+        return results
+
     store = load_vector_store(
         api_key=api_key,
         base_url=base_url,
@@ -379,15 +515,94 @@ def get_relevant_context_from_vector_store(
     )
     if not store:
         logging.info("No vector store found. Returning empty context.")
-        return ""
+        return results
+
+    embeddings = _get_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    q_embs = embeddings.embed_documents(list(queries))
+    scope = (interface_format, embedding_model_name, k)
+
+    pending = []  # (下标, 查询向量, 归一化向量)
+    for i, (query, q_emb) in enumerate(zip(queries, q_embs)):
+        if not q_emb:
+            logging.warning(f"Empty embedding for query '{query}'. Skipping retrieval.")
+            continue
+        q_vec = _normalize_vector(q_emb)
+        if q_vec is not None:
+            cached = _lookup_query_cache(scope, q_vec)
+            if cached is not None:
+                logging.info(f"Query cache hit for '{query}'.")
+                results[i] = list(cached)
+                continue
+        pending.append((i, q_emb, q_vec))
+
+    if not pending:
+        return results
+
+    async def search_all():
+        return await asyncio.gather(
+            *[store.asimilarity_search_by_vector(q_emb, k=k) for _, q_emb, _ in pending]
+        )
 
-    docs = store.similarity_search(query, k=k)
-    if not docs:
-        logging.info(f"No relevant documents found for query '{query}'. Returning empty context.")
-        return ""
+    for (i, _, q_vec), docs in zip(pending, asyncio.run(search_all())):
+        if not docs:
+            logging.info(f"No relevant documents found for query '{queries[i]}'. Returning empty context.")
+            continue
+        contents = [d.page_content for d in docs]
+        if q_vec is not None:
+            _save_query_cache(scope, q_vec, tuple(contents))
+        results[i] = contents
+    return results
+
+
+# ============ 检索结果语义缓存 ============
+# 保存最近的 (检索范围, 归一化查询向量, 命中文本元组)，按 LRU 淘汰；
+# 新查询与缓存查询的余弦相似度达到阈值即直接复用结果。向量库有写入时整体失效。
+_QUERY_CACHE_MAX = 128
+_QUERY_CACHE_THRESHOLD = 0.97
+_query_cache: List[tuple] = []
+_query_cache_lock = threading.Lock()
+
+
+def _normalize_vector(vec: List[float]) -> Optional[np.ndarray]:
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    if arr.size == 0 or norm == 0:
+        return None
+    return arr / norm
+
+
+def _lookup_query_cache(scope: tuple, q_vec: np.ndarray) -> Optional[tuple]:
+    with _query_cache_lock:
+        candidates = [i for i, entry in enumerate(_query_cache)
+                      if entry[0] == scope and entry[1].shape == q_vec.shape]
+        if not candidates:
+            return None
+        sims = np.stack([_query_cache[i][1] for i in candidates]) @ q_vec
+        best = int(np.argmax(sims))
+        if sims[best] < _QUERY_CACHE_THRESHOLD:
+            return None
+        entry = _query_cache.pop(candidates[best])
+        _query_cache.append(entry)
+        return entry[2]
+
+
+def _save_query_cache(scope: tuple, q_vec: np.ndarray, result: tuple):
+    with _query_cache_lock:
+        _query_cache.append((scope, q_vec, result))
+        if len(_query_cache) > _QUERY_CACHE_MAX:
+            _query_cache.pop(0)
 
-    combined = "\n".join([d.page_content for d in docs])
-    return combined
+
+def clear_query_cache():
+    """
+    清空检索结果缓存，向量库内容变化后调用
+    """
+    with _query_cache_lock:
+        _query_cache.clear()
+
+
+# 写入设定/目录前需去除的 Markdown 符号，一次遍历完成
+_CLEAN_TBL = str.maketrans('', '', '#*')
 
 
 # ============ 1. 独立：生成小说“设定” (Novel_setting.txt) ============
@@ -408,14 +623,7 @@ def Novel_setting_generate(
     """
     os.makedirs(filepath, exist_ok=True)
 
-    model = ChatOpenAI(
-        model=llm_model,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),  # 确保带 /v1
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(llm_model, api_key, base_url, temperature)
 
     # Step1: 基础设定
     prompt_base = set_prompt.format(
@@ -448,10 +656,8 @@ def Novel_setting_generate(
 
     # 写入 Novel_setting.txt
     filename_set = os.path.join(filepath, "Novel_setting.txt")
-    clear_file_content(filename_set)
-
-    final_novel_setting_cleaned = final_novel_setting.replace('#', '').replace('*', '')
-    save_string_to_txt(final_novel_setting_cleaned, filename_set)
+    final_novel_setting_cleaned = final_novel_setting.translate(_CLEAN_TBL)
+    atomic_write_text(filename_set, final_novel_setting_cleaned)
 
     logging.info("Novel_setting.txt has been generated successfully.")
 
@@ -475,14 +681,7 @@ def Novel_directory_generate(
         logging.warning("Novel_setting.txt 内容为空，请先生成小说设定。")
         return
 
-    model = ChatOpenAI(
-        model=llm_model,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(llm_model, api_key, base_url, temperature)
 
     # 生成目录
     prompt_dir = novel_directory_prompt.format(
@@ -496,32 +695,53 @@ def Novel_directory_generate(
 
     # 写入 Novel_directory.txt
     filename_dir = os.path.join(filepath, "Novel_directory.txt")
-    clear_file_content(filename_dir)
-
-    final_novel_directory_cleaned = final_novel_directory.replace('#', '').replace('*', '')
-    save_string_to_txt(final_novel_directory_cleaned, filename_dir)
+    final_novel_directory_cleaned = final_novel_directory.translate(_CLEAN_TBL)
+    atomic_write_text(filename_dir, final_novel_directory_cleaned)
 
     logging.info("Novel_directory.txt has been generated successfully.")
 
 
 # ============ 获取最近 N 章内容，生成短期摘要 ============
+@functools.lru_cache(maxsize=32)
+def _load_chapter(chap_file: str, mtime_ns: int, size: int) -> str:
+    """
+    通过 mmap 读取章节文件并解码。mtime_ns 与 size 只参与缓存键：
+    无论是本模块还是界面保存了章节，文件一变化旧缓存就不会再命中。
+    二进制读取不做换行转换，这里手动统一为 '\n'，与 read_file 的文本模式结果一致
+    （Windows 下文本模式写入的文件为 '\r\n'）。
+    """
+    if size == 0:
+        return ""
+    with open(chap_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[:].decode('utf-8')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _read_chapter_text(chap_file: str) -> str:
+    try:
+        st = os.stat(chap_file)
+        return _load_chapter(chap_file, st.st_mtime_ns, st.st_size).strip()
+    except FileNotFoundError:
+        return ""
+    except Exception:
+        logging.warning(f"Failed to read chapter file {chap_file}:\n{traceback.format_exc()}")
+        return ""
+
+
 def get_last_n_chapters_text(chapters_dir: str, current_chapter_num: int, n: int = 3) -> List[str]:
     """
     从指定文件夹中，读取最近 n 章的内容（如果存在），并按从旧到新的顺序返回文本列表。
-    不包含当前章，只拿之前的 n 章。
+    不包含当前章，只拿之前的 n 章；不存在或为空的章节不会出现在列表中。
     """
-    texts = []
     start_chap = max(1, current_chapter_num - n)
-    for c in range(start_chap, current_chapter_num):
-        chap_file = os.path.join(chapters_dir, f"chapter_{c}.txt")
-        if os.path.exists(chap_file):
-            text = read_file(chap_file).strip()
-            if text:
-                texts.append(text)
-    if len(texts) < n:
-        # 如果前面章节不足 n 章，用空字符串填充
-        texts = [''] * (n - len(texts)) + texts
-    return texts
+    chap_files = [os.path.join(chapters_dir, f"chapter_{c}.txt") for c in range(start_chap, current_chapter_num)]
+    if not chap_files:
+        return []
+    # 几个章节文件互不依赖，并发读取
+    with ThreadPoolExecutor(max_workers=len(chap_files)) as executor:
+        texts = list(executor.map(_read_chapter_text, chap_files))
+    return [text for text in texts if text]
 
 
 def summarize_recent_chapters(
@@ -534,19 +754,10 @@ def summarize_recent_chapters(
     """
     将最近几章文本拼接，通过模型生成相对简要的“短期内容摘要”。
     """
-    if not chapters_text_list:
-        return ""
     if all(not txt.strip() for txt in chapters_text_list):
         return "暂无摘要。"
 
-    model = ChatOpenAI(
-        model=llm_model,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(llm_model, api_key, base_url, temperature)
 
     combined_text = "\n".join(chapters_text_list)
     prompt = f"""你是一名资深长篇小说写作辅助AI，下面是最近几章的合并文本：
@@ -582,19 +793,26 @@ def update_plot_arcs(
         model_name: str,
         temperature: float
 ) -> str:
-    model = ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    return run_in_llm_loop(async_update_plot_arcs(
+        chapter_text, old_plot_arcs, api_key, base_url, model_name, temperature
+    ))
+
+
+async def async_update_plot_arcs(
+        chapter_text: str,
+        old_plot_arcs: str,
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        temperature: float,
+        tag: str = ""
+) -> str:
+    model = _get_chat(model_name, api_key, base_url, temperature)
     prompt = PLOT_ARCS_PROMPT.format(
         chapter_text=chapter_text,
         old_plot_arcs=old_plot_arcs
     )
-    arcs_text = invoke_with_cleaning(model, prompt)
+    arcs_text = await async_invoke_with_cleaning(model, prompt, tag=tag)
     if not arcs_text:
         logging.warning("update_plot_arcs: No response or empty result.")
         return old_plot_arcs
@@ -636,31 +854,25 @@ def generate_chapter_draft(
         queries.append(chapter_brief)
     queries.append("回顾剧情")
 
-    relevant_context = ""
-    for q in queries:
-        partial_context = get_relevant_context_from_vector_store(
+    context_parts = [
+        page_content
+        for docs in get_relevant_contexts_from_vector_store(
             api_key=api_key,
             base_url=base_url,
-            query=q,
+            queries=queries,
             interface_format=interface_format,
             embedding_model_name=embedding_model_name,
             embedding_base_url=embedding_base_url,
             k=2
         )
-        if partial_context.strip():
-            relevant_context += "\n" + partial_context
-    if not relevant_context:
-        relevant_context = "暂无相关内容。"
+        for page_content in docs
+        if page_content.strip()
+    ]
+    # 多个查询常命中相同的段落，按段落去重（保留首次出现的顺序）后一次性拼接
+    relevant_context = "\n".join(dict.fromkeys(context_parts)) or "暂无相关内容。"
 
     # 创建 ChatOpenAI，用于大纲和写作
-    model = ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(model_name, api_key, base_url, temperature)
 
     # 3) 生成本章大纲
     outline_prompt_text = chapter_outline_prompt.format(
@@ -679,8 +891,7 @@ def generate_chapter_draft(
     outlines_dir = os.path.join(filepath, "outlines")
     os.makedirs(outlines_dir, exist_ok=True)
     outline_file = os.path.join(outlines_dir, f"outline_{novel_number}.txt")
-    clear_file_content(outline_file)
-    save_string_to_txt(chapter_outline, outline_file)
+    atomic_write_text(outline_file, chapter_outline)
 
     # 4) 生成正文草稿
     writing_prompt_text = chapter_write_prompt.format(
@@ -700,14 +911,17 @@ def generate_chapter_draft(
     chapters_dir = os.path.join(filepath, "chapters")
     os.makedirs(chapters_dir, exist_ok=True)
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
-    clear_file_content(chapter_file)
-    save_string_to_txt(chapter_content, chapter_file)
+    atomic_write_text(chapter_file, chapter_content)
 
     logging.info(f"[Draft] Chapter {novel_number} generated as a draft.")
     return chapter_content
 
 
 # ============ 定稿章节 ============
+# 定稿时篇幅不足的最大扩写轮数
+MAX_ENRICH_ROUNDS = 2
+
+
 def finalize_chapter(
         novel_number: int,
         word_number: int,
@@ -729,7 +943,7 @@ def finalize_chapter(
     """
     chapters_dir = os.path.join(filepath, "chapters")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
-    chapter_text = read_file(chapter_file).strip()
+    chapter_text = _read_chapter_text(chapter_file)
     if not chapter_text:
         logging.warning(f"Chapter {novel_number} is empty, cannot finalize.")
         return
@@ -742,10 +956,14 @@ def finalize_chapter(
     old_global_summary = read_file(global_summary_file)
     old_plot_arcs = read_file(plot_arcs_file)
 
-    # 若篇幅过短，二次扩写
-    if len(chapter_text) < 0.8 * word_number:
+    # 若篇幅过短则扩写，最多 MAX_ENRICH_ROUNDS 轮，避免模型反复返回短文本时无限重试
+    # （Python 的 str 按码点计数，中文字数直接用 len 即可）
+    enriched = False
+    for _ in range(MAX_ENRICH_ROUNDS):
+        if len(chapter_text) >= 0.8 * word_number:
+            break
         logging.info("Chapter text is shorter than 80% of desired length. Enriching...")
-        chapter_text = enrich_chapter_text(
+        enriched_text = enrich_chapter_text(
             chapter_text=chapter_text,
             word_number=word_number,
             api_key=api_key,
@@ -753,57 +971,55 @@ def finalize_chapter(
             model_name=model_name,
             temperature=temperature
         )
-        clear_file_content(chapter_file)
-        save_string_to_txt(chapter_text, chapter_file)
+        if enriched_text == chapter_text:
+            # 扩写失败时 enrich_chapter_text 会原样返回，再试也没有意义
+            break
+        chapter_text = enriched_text
+        enriched = True
+    if enriched:
+        atomic_write_text(chapter_file, chapter_text)
 
     # 更新全局摘要
-    model = ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(model_name, api_key, base_url, temperature)
 
-    def update_global_summary(chapter_text: str, old_summary: str) -> str:
+    async def update_global_summary(chapter_text: str, old_summary: str) -> str:
         prompt = summary_prompt.format(
             chapter_text=chapter_text,
             global_summary=old_summary
         )
-        return invoke_with_cleaning(model, prompt) or old_summary
-
-    new_global_summary = update_global_summary(chapter_text, old_global_summary)
+        return await async_invoke_with_cleaning(model, prompt, tag="全局摘要") or old_summary
 
     # 更新角色状态
-    def update_character_state(chapter_text: str, old_state: str) -> str:
+    async def update_character_state(chapter_text: str, old_state: str) -> str:
         prompt = update_character_state_prompt.format(
             chapter_text=chapter_text,
             old_state=old_state
         )
-        return invoke_with_cleaning(model, prompt) or old_state
+        return await async_invoke_with_cleaning(model, prompt, tag="角色状态") or old_state
+
+    # 全局摘要、角色状态、剧情要点三者只依赖本章文本和各自旧值，彼此独立，
+    # 在同一个事件循环中并发请求，共用同一个客户端的连接池
+    async def run_updates():
+        return await asyncio.gather(
+            update_global_summary(chapter_text, old_global_summary),
+            update_character_state(chapter_text, old_char_state),
+            async_update_plot_arcs(
+                chapter_text=chapter_text,
+                old_plot_arcs=old_plot_arcs,
+                api_key=api_key,
+                base_url=base_url,
+                model_name=model_name,
+                temperature=temperature,
+                tag="剧情要点"
+            )
+        )
 
-    new_char_state = update_character_state(chapter_text, old_char_state)
-
-    # 更新剧情要点
-    new_plot_arcs = update_plot_arcs(
-        chapter_text=chapter_text,
-        old_plot_arcs=old_plot_arcs,
-        api_key=api_key,
-        base_url=base_url,
-        model_name=model_name,
-        temperature=temperature
-    )
+    new_global_summary, new_char_state, new_plot_arcs = run_in_llm_loop(run_updates())
 
     # 写回文件
-    clear_file_content(character_state_file)
-    save_string_to_txt(new_char_state, character_state_file)
-
-    clear_file_content(global_summary_file)
-    save_string_to_txt(new_global_summary, global_summary_file)
-
-    clear_file_content(plot_arcs_file)
-    save_string_to_txt(new_plot_arcs, plot_arcs_file)
+    atomic_write_text(character_state_file, new_char_state)
+    atomic_write_text(global_summary_file, new_global_summary)
+    atomic_write_text(plot_arcs_file, new_plot_arcs)
 
     # 更新向量库
     update_vector_store(
@@ -828,14 +1044,7 @@ def enrich_chapter_text(
     """
     当章节篇幅不足时，调用此函数对章节文本进行二次扩写。
     """
-    model = ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        base_url=ensure_openai_base_url_has_v1(base_url),
-        temperature=temperature,
-        max_tokens=8192,
-        max_retries=100
-    )
+    model = _get_chat(model_name, api_key, base_url, temperature)
     prompt = f"""以下是当前章节文本，可能篇幅较短，请在保持剧情连贯的前提下进行扩写，使其更充实、生动，并尽量靠近目标 {word_number} 字数。
 
 原章节内容：
@@ -866,77 +1075,168 @@ def import_knowledge_file(
         logging.warning("知识库文件内容为空。")
         return
 
-    nltk.download('punkt', quiet=True)
-
-    paragraphs = advanced_split_content(content)
+    # 段落由生成器逐批产出，每批只发一次 embedding 请求，全部段落不会同时驻留内存
+    embeddings = _get_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+    paragraphs = advanced_split_content(content, embeddings)
+    batches = _iter_batches(paragraphs, EMBED_BATCH_SIZE)
+    first_batch = next(batches, None)
+    if not first_batch:
+        logging.warning("知识库文件切分后无有效段落。")
+        return
 
-    store = load_vector_store(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
-    if not store:
+    if _store_exists:
+        store, _ = _get_store_and_embeddings(api_key, base_url, interface_format, embedding_model_name, embedding_base_url)
+        batches = itertools.chain([first_batch], batches)
+    else:
         logging.info("Vector store does not exist. Initializing a new one for knowledge import...")
-        init_vector_store(
+        store = init_vector_store(
             api_key,
             base_url,
             interface_format,
             embedding_model_name,
-            paragraphs,
+            first_batch,
             embedding_base_url
         )
-        return
 
-    docs = [Document(page_content=str(p)) for p in paragraphs]
-    store.add_documents(docs)
+    # 每次最多 EMBED_MAX_CONCURRENCY 批并发请求 embedding
+    for window in _iter_batches(batches, EMBED_MAX_CONCURRENCY):
+        _add_embedded_batches(store, embeddings, window)
     store.persist()
+    clear_query_cache()
     logging.info("知识库文件已成功导入至向量库。")
 
 
-def advanced_split_content(content: str,
-                           similarity_threshold: float = 0.7,
-                           max_length: int = 500) -> List[str]:
+def _iter_batches(iterable, size: int) -> Iterator[list]:
     """
-    将文本先按句子切分，然后根据语义相似度进行合并，最后按 max_length 二次切分。
-    可根据需要微调此逻辑。
+    将任意可迭代对象按 size 个一组切分，逐组产出列表
     """
-    sentences = nltk.sent_tokenize(content)
-    if not sentences:
-        return []
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
-    model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-    embeddings = model.encode(sentences)
+def _add_embedded_batches(store: Chroma, embeddings, batches: List[List[str]]) -> None:
+    """
+    并发计算多批文本的 embedding，再连同向量直接写入 Chroma 集合，
+    避免 add_texts 在写入时逐批串行地重新请求 embedding。
+    """
+    async def embed_all():
+        return await asyncio.gather(
+            *[asyncio.to_thread(embeddings.embed_documents, batch) for batch in batches]
+        )
+
+    for batch, vectors in zip(batches, asyncio.run(embed_all())):
+        store._collection.add(
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=vectors,
+            documents=batch
+        )
 
-    merged_paragraphs = []
-    current_sentences = [sentences[0]]
-    current_embedding = embeddings[0]
 
-    for i in range(1, len(sentences)):
-        sim = cosine_similarity([current_embedding], [embeddings[i]])[0][0]
-        if sim >= similarity_threshold:
-            current_sentences.append(sentences[i])
-            current_embedding = (current_embedding + embeddings[i]) / 2.0
+def _streaming_merge_py(embeddings: np.ndarray, lengths: np.ndarray,
+                        threshold: float, max_length: int) -> np.ndarray:
+    """
+    与当前段落的平均向量比较余弦相似度，返回每个新段落起始句子的下标。
+    相似度低于 threshold，或并入后段落长度超过 max_length 时另起一段。
+    embeddings 需已 L2 归一化：平均向量与向量和方向相同，只需维护向量和，
+    每步只对向量和开一次方。
+    """
+    n = embeddings.shape[0]
+    boundaries = np.empty(n, dtype=np.int64)
+    count = 0
+    cur = embeddings[0].astype(np.float64)
+    cur_len = lengths[0]
+    for i in range(1, n):
+        vec = embeddings[i]
+        norm = np.sqrt((cur * cur).sum())
+        sim = (cur * vec).sum() / norm if norm > 0.0 else 0.0
+        if sim >= threshold and cur_len + lengths[i] <= max_length:
+            cur += vec
+            cur_len += lengths[i]
         else:
-            merged_paragraphs.append(" ".join(current_sentences))
-            current_sentences = [sentences[i]]
-            current_embedding = embeddings[i]
+            boundaries[count] = i
+            count += 1
+            cur = vec.astype(np.float64)
+            cur_len = lengths[i]
+    return boundaries[:count]
+
+
+def _adaptive_threshold(embeddings: np.ndarray, total_length: int, max_length: int) -> float:
+    """
+    不同 embedding 模型的余弦相似度分布差异很大，固定阈值换个模型就会失效。
+    这里按本文相邻句子相似度的排名取阈值：期望切出约 total_length / max_length 段，
+    就取相似度最低的那部分位置作为断点；文本不足一段时只按长度合并。
+    """
+    n_breaks = math.ceil(total_length / max_length) - 1
+    if n_breaks <= 0 or embeddings.shape[0] < 2:
+        return float('-inf')
+    adjacent = (embeddings[1:] * embeddings[:-1]).sum(axis=1)
+    return float(np.quantile(adjacent, min(1.0, n_breaks / adjacent.shape[0])))
+
 
-    if current_sentences:
-        merged_paragraphs.append(" ".join(current_sentences))
+# 句子切分：遇到中英文句末标点（连同其后的闭合引号/括号）或换行即断句；
+# 英文句点只在其后为空白或行尾时才断句，避免切开小数（“Mr. Smith”这类缩写仍会被断开）
+_SENT_RE = re.compile(r'[^\n]+?(?:[。！？!?…]+[”’"』」）)]*|\.+(?=\s|$)|$)', re.M)
 
-    final_segments = []
-    for para in merged_paragraphs:
+
+@functools.lru_cache(maxsize=1)
+def _get_streaming_merge():
+    """
+    首次使用时才导入 numba 并编译 _streaming_merge_py，避免拖慢程序启动。
+    不开启 cache=True：PyInstaller 打包后模块源码位于 PYZ 归档中，numba 找不到 .py 文件会直接报错；
+    编译结果由 lru_cache 在进程内复用。
+    """
+    from numba import njit
+    return njit(fastmath=True)(_streaming_merge_py)
+
+
+def advanced_split_content(content: str,
+                           embedder,
+                           similarity_threshold: Optional[float] = None,
+                           max_length: int = 500) -> Iterator[str]:
+    """
+    将文本先按句子切分，然后根据语义相似度并按 max_length 控制长度进行合并，超长的单句再二次切分。
+    embedder 为任意带 embed_documents 方法的 embeddings 对象（即向量库使用的同一个）。
+    similarity_threshold 为空时按本文的相似度分布自动取阈值，与所用 embedding 模型无关；
+    明确知道模型的相似度尺度时（如本地 MiniLM 约 0.7）可直接指定。
+    以生成器形式逐段产出，可根据需要微调此逻辑。
+    """
+    matches = [m for m in _SENT_RE.finditer(content) if m.group().strip()]
+    if not matches:
+        return
+    sentences = [m.group().strip() for m in matches]
+    # 每句的长度计入它与上一句之间的分隔，合并后的长度即原文截取的长度
+    lengths = np.array(
+        [matches[0].end() - matches[0].start()]
+        + [cur.end() - prev.end() for prev, cur in zip(matches, matches[1:])],
+        dtype=np.int64
+    )
+
+    embeddings = np.asarray(embedder.embed_documents(sentences), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.where(norms > 0, norms, 1.0)
+    if similarity_threshold is None:
+        similarity_threshold = _adaptive_threshold(embeddings, int(lengths.sum()), max_length)
+    boundaries = _get_streaming_merge()(
+        np.ascontiguousarray(embeddings), lengths, float(similarity_threshold), max_length
+    )
+
+    starts = [0, *boundaries]
+    ends = [*boundaries, len(sentences)]
+    for start, end in zip(starts, ends):
+        # 段落直接从原文截取，保留句子之间原有的分隔（中文句间不插入空格）
+        para = content[matches[start].start():matches[end - 1].end()].strip()
         if len(para) > max_length:
-            sub_segments = split_by_length(para, max_length=max_length)
-            final_segments.extend(sub_segments)
+            yield from split_by_length(para, max_length=max_length)
         else:
-            final_segments.append(para)
-
-    return final_segments
+            yield para
 
 
-def split_by_length(text: str, max_length: int = 500) -> List[str]:
-    segments = []
-    start_idx = 0
-    while start_idx < len(text):
-        end_idx = min(start_idx + max_length, len(text))
-        segment = text[start_idx:end_idx]
-        segments.append(segment.strip())
-        start_idx = end_idx
-    return segments
+def split_by_length(text: str, max_length: int = 500) -> Iterator[str]:
+    for start_idx in range(0, len(text), max_length):
+        segment = text[start_idx:start_idx + max_length].strip()
+        if segment:
+            yield segment
@@ -0,0 +1,88 @@
+# test_think_filter.py
+# -*- coding: utf-8 -*-
+import random
+import re
+import unittest
+from types import SimpleNamespace
+
+from think_filter import ThinkTagFilter
+
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+
+def _run_turns(turns):
+    """每个 turn 是一轮回复的 chunk 列表，全部轮次共用同一个过滤器"""
+    think_filter = ThinkTagFilter()
+    out = [think_filter.feed(chunk) for turn in turns for chunk in turn]
+    out.append(think_filter.flush())
+    return "".join(out)
+
+
+class ThinkTagFilterTest(unittest.TestCase):
+    def test_span_across_turns(self):
+        turns = [["<think>推理…"], ["继续推理</think>正文###"]]
+        self.assertEqual(_run_turns(turns), "正文###")
+
+    def test_tag_split_across_turns(self):
+        turns = [["开头<th"], ["ink>思考</thi"], ["nk>正文###"]]
+        self.assertEqual(_run_turns(turns), "开头正文###")
+
+    def test_unclosed_span_is_kept(self):
+        turns = [["正文<think>没写完"], ["的思考###"]]
+        self.assertEqual(_run_turns(turns), "正文<think>没写完的思考###")
+
+    def test_matches_regex_on_joined_text(self):
+        rng = random.Random(0)
+        alphabet = ['<think>', '</think>', '<', '</', '<th', 'think>', 'a', 'b', '\n', '>', 't']
+        for _ in range(5000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            cuts = sorted(rng.sample(range(len(text) + 1), rng.randint(0, min(5, len(text) + 1))))
+            pieces = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+            # 随机把 chunk 分到若干轮中，模拟续写
+            turns, turn = [], []
+            for piece in pieces:
+                turn.append(piece)
+                if rng.random() < 0.3:
+                    turns.append(turn)
+                    turn = []
+            turns.append(turn)
+            self.assertEqual(_run_turns(turns), _THINK_RE.sub('', text), msg=repr(pieces))
+
+
+class _FakeChat:
+    """按轮次依次流式返回预设 chunk 的假模型"""
+    model_name = "fake"
+    temperature = 0.7
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.seen_messages = []
+
+    def model_dump_json(self):
+        return "{}"
+
+    async def astream(self, messages):
+        self.seen_messages.append([m.content for m in messages])
+        for chunk in self.turns.pop(0):
+            yield SimpleNamespace(content=chunk)
+
+
+class InvokeWithCleaningTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import novel_generator
+        except ImportError as e:
+            raise unittest.SkipTest(f"无法导入 novel_generator（需要安装 langchain 等依赖）：{e}")
+        cls.novel_generator = novel_generator
+
+    def test_think_span_across_continuation_turns(self):
+        invoke_with_cleaning = self.novel_generator.invoke_with_cleaning
+        chat = _FakeChat([["<think>推理", "…"], ["继续推理</think>", "正文###"]])
+        self.assertEqual(invoke_with_cleaning(chat, "写一段正文"), "正文###")
+        # 续写请求中带着上一轮的原始文本，模型才能接着把思考写完
+        self.assertIn("<think>推理…", chat.seen_messages[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
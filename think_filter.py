@@ -0,0 +1,65 @@
+# think_filter.py
+# -*- coding: utf-8 -*-
+
+_THINK_OPEN = '<think>'
+_THINK_CLOSE = '</think>'
+
+
+def _partial_tag_len(text: str, tag: str) -> int:
+    """
+    返回 text 末尾能构成 tag 前缀的最长长度，用于跨 chunk 匹配被截断的标签
+    """
+    for n in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+class ThinkTagFilter:
+    """
+    流式过滤 <think>...</think>：逐块喂入，只返回思考区间之外的文本。
+    一次完整回答（含所有续写轮次）共用一个实例，全部喂完后调用一次 flush，
+    结果与对整段回答执行 re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL) 一致；
+    未闭合的 <think> 在 flush 时原样交还，避免模型漏写结束标签时丢掉正文。
+    """
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""        # 可能是被截断的标签前缀，等下一块再判断
+        self.think_parts = []    # 当前思考区间的内容，仅在标签未闭合时才会用到
+
+    def feed(self, chunk: str) -> str:
+        buf = self.pending + chunk
+        self.pending = ""
+        out = []
+        while buf:
+            if not self.in_think:
+                idx = buf.find(_THINK_OPEN)
+                if idx < 0:
+                    keep = _partial_tag_len(buf, _THINK_OPEN)
+                    out.append(buf[:len(buf) - keep])
+                    self.pending = buf[len(buf) - keep:]
+                    break
+                out.append(buf[:idx])
+                buf = buf[idx + len(_THINK_OPEN):]
+                self.in_think = True
+                self.think_parts = []
+            else:
+                idx = buf.find(_THINK_CLOSE)
+                if idx < 0:
+                    keep = _partial_tag_len(buf, _THINK_CLOSE)
+                    self.think_parts.append(buf[:len(buf) - keep])
+                    self.pending = buf[len(buf) - keep:]
+                    break
+                buf = buf[idx + len(_THINK_CLOSE):]
+                self.in_think = False
+                self.think_parts = []
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest = self.pending
+        if self.in_think:
+            rest = _THINK_OPEN + "".join(self.think_parts) + rest
+        self.in_think = False
+        self.pending = ""
+        self.think_parts = []
+        return rest
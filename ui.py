@@ -10,7 +10,7 @@ import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import traceback
 from config_manager import load_config, save_config
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file, atomic_write_text
 from novel_generator import (
     Novel_setting_generate,
     Novel_directory_generate,
@@ -816,8 +816,7 @@ class NovelGeneratorGUI:
         chapter_file = os.path.join(filepath, "chapters", f"chapter_{chapter_number_str}.txt")
         content = self.chapter_view_text.get("0.0", "end").strip()
 
-        clear_file_content(chapter_file)
-        save_string_to_txt(content, chapter_file)
+        atomic_write_text(chapter_file, content)
         self.safe_log(f"已保存对第 {chapter_number_str} 章的修改。")
 
     def prev_chapter(self):
@@ -1331,8 +1330,7 @@ class NovelGeneratorGUI:
             return
         content = self.setting_text.get("0.0", "end").strip()
         setting_file = os.path.join(filepath, "Novel_setting.txt")
-        clear_file_content(setting_file)
-        save_string_to_txt(content, setting_file)
+        atomic_write_text(setting_file, content)
         self.log("已保存对 Novel_setting.txt 的修改。")
 
     def load_novel_directory(self):
@@ -1353,8 +1351,7 @@ class NovelGeneratorGUI:
             return
         content = self.directory_text.get("0.0", "end").strip()
         directory_file = os.path.join(filepath, "Novel_directory.txt")
-        clear_file_content(directory_file)
-        save_string_to_txt(content, directory_file)
+        atomic_write_text(directory_file, content)
         self.log("已保存对 Novel_directory.txt 的修改。")
 
     def load_character_state(self):
@@ -1375,8 +1372,7 @@ class NovelGeneratorGUI:
             return
         content = self.character_text.get("0.0", "end").strip()
         char_file = os.path.join(filepath, "character_state.txt")
-        clear_file_content(char_file)
-        save_string_to_txt(content, char_file)
+        atomic_write_text(char_file, content)
         self.log("已保存对 character_state.txt 的修改。")
 
     def load_global_summary(self):
@@ -1397,8 +1393,7 @@ class NovelGeneratorGUI:
             return
         content = self.summary_text.get("0.0", "end").strip()
         summary_file = os.path.join(filepath, "global_summary.txt")
-        clear_file_content(summary_file)
-        save_string_to_txt(content, summary_file)
+        atomic_write_text(summary_file, content)
         self.log("已保存对 global_summary.txt 的修改。")
 
 
@@ -42,6 +42,16 @@ def save_string_to_txt(content: str, filename: str):
     except Exception as e:
         print(f"[save_string_to_txt] 保存文件时发生错误: {e}")
 
+def atomic_write_text(filename: str, content: str):
+    """先写入临时文件再替换目标文件（覆盖写），一次打开即可完成，且写入中途出错不会留下被截断的文件。"""
+    tmp_filename = filename + '.tmp'
+    try:
+        with open(tmp_filename, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(tmp_filename, filename)
+    except Exception as e:
+        print(f"[atomic_write_text] 保存文件时发生错误: {e}")
+
 def save_data_to_json(data: dict, file_path: str) -> bool:
     """将数据保存到 JSON 文件。"""
     try: